@@ -6,6 +6,7 @@ Import and use these functions in your API endpoints for database operations.
 """
 
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -17,6 +18,8 @@ load_dotenv()
 
 _client = None
 db = None
+_async_client = None
+async_db = None
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
@@ -24,6 +27,8 @@ database_name = os.getenv("DATABASE_NAME")
 if database_url and database_name:
     _client = MongoClient(database_url)
     db = _client[database_name]
+    _async_client = AsyncIOMotorClient(database_url)
+    async_db = _async_client[database_name]
 
 # Helper functions for common database operations
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
@@ -43,13 +48,63 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     result = db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally projecting only the fields needed"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
+
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
-    
+
     return list(cursor)
+
+async def create_document_async(collection_name: str, data: Union[BaseModel, dict], write_concern=None):
+    """Insert a single document with timestamp (async, for use in async endpoints)
+
+    Pass a pymongo.WriteConcern (e.g. w=0) to trade durability for latency
+    on low-consequence collections; the default keeps acknowledged writes.
+    """
+    if async_db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    # Convert Pydantic model to dict if needed
+    if isinstance(data, BaseModel):
+        data_dict = data.model_dump()
+    else:
+        data_dict = data.copy()
+
+    data_dict['created_at'] = datetime.now(timezone.utc)
+    data_dict['updated_at'] = datetime.now(timezone.utc)
+
+    collection = async_db[collection_name]
+    if write_concern is not None:
+        collection = async_db.get_collection(collection_name, write_concern=write_concern)
+    result = await collection.insert_one(data_dict)
+    return str(result.inserted_id)
+
+async def get_documents_async(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection (async, for use in async endpoints)"""
+    if async_db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    cursor = async_db[collection_name].find(filter_dict or {}, projection)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    return await cursor.to_list(length=limit)
+
+async def get_top_async(collection_name: str, sort: list, limit: int, projection: dict = None):
+    """Get the top documents sorted server-side (async). `sort` is a list of (field, direction) pairs."""
+    if async_db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    cursor = async_db[collection_name].find({}, projection).sort(sort).limit(limit)
+    return await cursor.to_list(length=limit)
+
+def get_top_cursor(collection_name: str, sort: list, limit: int, projection: dict = None):
+    """Like get_top_async, but returns the motor cursor so callers can stream batches"""
+    if async_db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return async_db[collection_name].find({}, projection).sort(sort).limit(limit)
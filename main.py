@@ -1,15 +1,24 @@
 import os
+import re
 import time
-import secrets
+import asyncio
+import base64
 import hashlib
+import hmac
+import anyio.to_thread
+from collections import deque
 from typing import Optional, List
 from fastapi import FastAPI, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter, field_validator
+from cachetools import TTLCache
+from bson import ObjectId
+from pymongo import WriteConcern
 
-from database import create_document, get_documents, db
+from database import create_document_async, get_documents_async, get_top_async, get_top_cursor, async_db
 
-app = FastAPI(title="Flex Backend", version="1.0.0")
+app = FastAPI(title="Flex Backend", version="1.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,16 +31,62 @@ app.add_middleware(
 # ----------------------
 # Utilities
 # ----------------------
-PASSWORD_SALT = os.getenv("PASSWORD_SALT", "flex-salt")
+PASSWORD_SALT = os.getenv("PASSWORD_SALT", "flex-salt")  # legacy app-wide salt
+_SALT_BYTES = PASSWORD_SALT.encode("utf-8")
 SESSION_TTL_SECONDS = 60 * 60 * 24 * 7  # 7 days
 
+# scrypt cost parameters (CPU/memory-hard KDF, runs in OpenSSL's C code)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256((PASSWORD_SALT + password).encode("utf-8")).hexdigest()
 
+def hash_password(password: str, salt: bytes) -> str:
+    return hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=salt,
+        n=SCRYPT_N,
+        r=SCRYPT_R,
+        p=SCRYPT_P,
+        dklen=32,
+    ).hex()
 
-def verify_password(password: str, password_hash: str) -> bool:
-    return hash_password(password) == password_hash
+
+def _legacy_hash_password(password: str) -> str:
+    # Pre-scrypt hashing scheme, kept so existing accounts can still log in;
+    # feeding salt and password separately skips the concatenated temporary
+    h = hashlib.sha256()
+    h.update(_SALT_BYTES)
+    h.update(password.encode("utf-8"))
+    return h.hexdigest()
+
+
+def verify_password(password: str, password_hash: str, salt: Optional[bytes] = None) -> bool:
+    if salt is None:
+        candidate = _legacy_hash_password(password)
+    else:
+        candidate = hash_password(password, salt)
+    return hmac.compare_digest(candidate, password_hash)
+
+
+# Session tokens are drawn from a pre-seeded pool so the OS RNG is hit once
+# per _TOKEN_POOL_SIZE tokens instead of once per register/login
+_TOKEN_BYTES = 32
+_TOKEN_POOL_SIZE = 1024
+_TOKEN_POOL_REFILL_AT = 64
+_token_pool: deque = deque()
+
+
+def _refill_token_pool():
+    raw = os.urandom(_TOKEN_BYTES * _TOKEN_POOL_SIZE)
+    for i in range(0, len(raw), _TOKEN_BYTES):
+        _token_pool.append(raw[i:i + _TOKEN_BYTES])
+
+
+def _next_token() -> str:
+    if len(_token_pool) < _TOKEN_POOL_REFILL_AT:
+        _refill_token_pool()
+    return base64.urlsafe_b64encode(_token_pool.popleft()).rstrip(b"=").decode("ascii")
 
 
 # ----------------------
@@ -43,24 +98,82 @@ class RegisterPayload(BaseModel):
     password: str
 
 
+# Cheap shape check for login: the DB lookup is the real gate, so skip
+# email-validator's full deliverability parsing on this hot path
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
 class LoginPayload(BaseModel):
-    email: EmailStr
+    email: str
     password: str
 
+    @field_validator("email")
+    @classmethod
+    def email_must_look_valid(cls, v: str) -> str:
+        if not _EMAIL_RE.match(v):
+            raise ValueError("Invalid email address")
+        return v
+
 
 class ScorePayload(BaseModel):
     value: int
 
 
+# Losing an individual score row is acceptable; don't block the event loop
+# waiting for Mongo to acknowledge each insert. Auth writes keep the default.
+_SCORE_WRITE_CONCERN = WriteConcern(w=0)
+
+
+class UserPublic(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str = Field(..., alias="_id")
+    email: str
+    display_name: str
+    high_score: int = 0
+    avatar: Optional[str] = None
+
+
+class AuthResponse(BaseModel):
+    token: str
+    user: UserPublic
+
+
 # ----------------------
 # Auth helpers
 # ----------------------
+# token -> (user_dict, session_expires_at); sessions are immutable until
+# expiry, so a short TTL only bounds staleness of the user fields
+_user_cache = TTLCache(maxsize=50_000, ttl=60)
+
+
+def invalidate_session(token: str):
+    """Drop a token from the auth cache (e.g. on logout)."""
+    _user_cache.pop(token, None)
+
+
 async def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing token")
 
-    token = authorization.replace("Bearer ", "").strip()
-    sessions = get_documents("session", {"token": token}, limit=1)
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid auth scheme")
+    token = authorization[7:].strip()
+
+    cached = _user_cache.get(token)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > time.time():
+            return user
+        invalidate_session(token)
+        raise HTTPException(status_code=401, detail="Session expired")
+
+    sessions = await get_documents_async(
+        "session",
+        {"token": token},
+        limit=1,
+        projection={"token": 1, "user_id": 1, "email": 1, "expires_at": 1, "user_snapshot": 1},
+    )
     if not sessions:
         raise HTTPException(status_code=401, detail="Invalid session")
 
@@ -68,24 +181,149 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
     if int(sess.get("expires_at", 0)) < int(time.time()):
         raise HTTPException(status_code=401, detail="Session expired")
 
-    user_id = sess.get("user_id")
-    users = get_documents("flexuser", {"_id": {"$eq": sess.get("user_id")}}, limit=1)
-    # Fallback if _id stored as str
-    if not users:
-        users = get_documents("flexuser", {"_id": user_id}, limit=1)
-    if not users:
-        # try email if stored
+    user = sess.get("user_snapshot")
+    if user is None:
+        # Sessions created before the snapshot was stored: dereference the user
+        # in a single $or query instead of up to three sequential round-trips
+        # (_id as ObjectId, _id as str, email)
+        user_id = sess.get("user_id")
+        or_clauses = []
+        if user_id:
+            if ObjectId.is_valid(user_id):
+                or_clauses.append({"_id": ObjectId(user_id)})
+            or_clauses.append({"_id": user_id})
         if sess.get("email"):
-            users = get_documents("flexuser", {"email": sess.get("email")}, limit=1)
-    if not users:
-        raise HTTPException(status_code=401, detail="User not found")
+            or_clauses.append({"email": sess.get("email")})
 
-    user = users[0]
-    # Remove sensitive fields
-    user.pop("password_hash", None)
+        users = []
+        if or_clauses:
+            users = await get_documents_async("flexuser", {"$or": or_clauses}, limit=1)
+        if not users:
+            raise HTTPException(status_code=401, detail="User not found")
+
+        user = users[0]
+        # Remove sensitive fields
+        user.pop("password_hash", None)
+        user.pop("password_salt", None)
+
+    _user_cache[token] = (user, int(sess.get("expires_at", 0)))
     return user
 
 
+# ----------------------
+# Rate limiting
+# ----------------------
+SCORE_RATE_PER_SEC = 10.0
+SCORE_BURST = 30.0
+
+# user_id -> (tokens, last_refill_ts). Bounded like the auth cache; the
+# refill/decrement below has no awaits, so it is atomic on the event loop
+# and needs no lock.
+_score_buckets = TTLCache(maxsize=50_000, ttl=60)
+
+
+def _allow_score_write(user_id: str) -> bool:
+    now = time.monotonic()
+    tokens, last = _score_buckets.get(user_id, (SCORE_BURST, now))
+    tokens = min(SCORE_BURST, tokens + (now - last) * SCORE_RATE_PER_SEC)
+    if tokens < 1.0:
+        _score_buckets[user_id] = (tokens, now)
+        return False
+    _score_buckets[user_id] = (tokens - 1.0, now)
+    return True
+
+
+# ----------------------
+# Leaderboard cache
+# ----------------------
+TOP_CACHE_SIZE = 100
+
+
+class ScoreEntry(BaseModel):
+    display_name: str = "Player"
+    value: int
+
+
+# Compiled once; validates/dumps whole lists of score docs in pydantic-core
+# instead of per-doc .get()/int() calls in Python
+_score_adapter = TypeAdapter(List[ScoreEntry])
+
+# Materialized top-K leaderboard, sorted by value desc. Updated on score
+# writes and persisted to the `leaderboard` singleton doc so it survives
+# restarts; reads of /scores/top become an in-process slice.
+_top_cache: List[dict] = []
+_top_cache_loaded = False
+_top_cache_lock = asyncio.Lock()
+
+
+async def _record_top_score(entry: dict):
+    async with _top_cache_lock:
+        if len(_top_cache) >= TOP_CACHE_SIZE and entry["value"] <= _top_cache[-1]["value"]:
+            return
+        _top_cache.append(entry)
+        _top_cache.sort(key=lambda e: e["value"], reverse=True)
+        del _top_cache[TOP_CACHE_SIZE:]
+        await async_db.leaderboard.replace_one(
+            {"_id": "top"},
+            {"_id": "top", "entries": _top_cache},
+            upsert=True,
+        )
+
+
+# ----------------------
+# Startup
+# ----------------------
+@app.on_event("startup")
+async def create_indexes():
+    if async_db is None:
+        return
+    # Backs the $sort + $limit in /scores/top
+    await async_db.score.create_index([("value", -1)])
+    # Backs the per-request session lookup in get_current_user
+    await async_db.session.create_index("token", unique=True)
+    # Mongo's TTL monitor deletes expired sessions; expires_at is an int, so
+    # the TTL rides on the created_at datetime written by create_document
+    await async_db.session.create_index("created_at", expireAfterSeconds=SESSION_TTL_SECONDS)
+    # Backs the email lookups in register/login
+    await async_db.flexuser.create_index("email", unique=True)
+
+
+COLLECTIONS_SNAPSHOT_TTL = 30  # seconds between list_collection_names refreshes
+
+
+@app.on_event("startup")
+async def snapshot_collections():
+    app.state.collections_snapshot = []
+    app.state.collections_snapshot_ts = 0.0
+    if async_db is None:
+        return
+    try:
+        app.state.collections_snapshot = (await async_db.list_collection_names())[:10]
+        app.state.collections_snapshot_ts = time.time()
+    except Exception:
+        # /test will retry the listing lazily
+        pass
+
+
+@app.on_event("startup")
+async def load_leaderboard():
+    global _top_cache, _top_cache_loaded
+    if async_db is None:
+        return
+    saved = await async_db.leaderboard.find_one({"_id": "top"})
+    if saved and saved.get("entries"):
+        _top_cache = saved["entries"]
+    else:
+        docs = await get_top_async(
+            "score",
+            sort=[("value", -1)],
+            limit=TOP_CACHE_SIZE,
+            projection={"display_name": 1, "value": 1, "_id": 0},
+        )
+        _top_cache = _score_adapter.dump_python(_score_adapter.validate_python(docs))
+    _top_cache_loaded = True
+
+
 # ----------------------
 # Routes
 # ----------------------
@@ -99,64 +337,91 @@ def hello():
     return {"message": "Hello from Flex API!"}
 
 
-@app.post("/auth/register")
-def register(payload: RegisterPayload):
+@app.post("/auth/register", response_model=AuthResponse, response_model_by_alias=True)
+async def register(payload: RegisterPayload):
     # Check duplicate
-    existing = get_documents("flexuser", {"email": payload.email}, limit=1)
+    existing = await get_documents_async("flexuser", {"email": payload.email}, limit=1, projection={"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user_doc = {
-        "email": str(payload.email),
-        "display_name": payload.display_name.strip(),
-        "password_hash": hash_password(payload.password),
-        "avatar": None,
-        "high_score": 0,
-        "is_active": True,
-    }
-    user_id = create_document("flexuser", user_doc)
-
-    token = secrets.token_urlsafe(32)
+    # Dump the already-validated payload once and shape it into the Mongo doc
+    user_doc = payload.model_dump()
+    user_doc["email"] = str(user_doc["email"])
+    user_doc["display_name"] = user_doc["display_name"].strip()
+    salt = os.urandom(16)
+    # scrypt is ~tens of ms of C work; run it in the threadpool (the GIL is
+    # released) so it doesn't stall the event loop
+    user_doc["password_hash"] = await anyio.to_thread.run_sync(hash_password, user_doc.pop("password"), salt)
+    user_doc["password_salt"] = salt.hex()
+    user_doc["avatar"] = None
+    user_doc["high_score"] = 0
+    user_doc["is_active"] = True
+    user_id = await create_document_async("flexuser", user_doc)
+
+    user_resp = UserPublic(
+        id=user_id,
+        email=user_doc["email"],
+        display_name=user_doc["display_name"],
+    )
+
+    token = _next_token()
     expires_at = int(time.time()) + SESSION_TTL_SECONDS
-    create_document("session", {
+    await create_document_async("session", {
         "user_id": user_id,
         "token": token,
-        "email": str(payload.email),
+        "email": user_doc["email"],
         "expires_at": expires_at,
+        "user_snapshot": user_resp.model_dump(by_alias=True),
     })
 
-    return {"token": token, "user": {"_id": user_id, "email": payload.email, "display_name": payload.display_name, "high_score": 0}}
-
-
-@app.post("/auth/login")
-def login(payload: LoginPayload):
-    users = get_documents("flexuser", {"email": payload.email}, limit=1)
+    return AuthResponse(token=token, user=user_resp)
+
+
+@app.post("/auth/login", response_model=AuthResponse, response_model_by_alias=True)
+async def login(payload: LoginPayload):
+    users = await get_documents_async(
+        "flexuser",
+        {"email": payload.email},
+        limit=1,
+        projection={
+            "password_hash": 1,
+            "password_salt": 1,
+            "email": 1,
+            "display_name": 1,
+            "high_score": 1,
+            "avatar": 1,
+        },
+    )
     if not users:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     user = users[0]
 
-    if not verify_password(payload.password, user.get("password_hash", "")):
+    salt_hex = user.get("password_salt")
+    salt = bytes.fromhex(salt_hex) if salt_hex else None
+    # Offload the scrypt verification like register's hash — see comment there
+    if not await anyio.to_thread.run_sync(verify_password, payload.password, user.get("password_hash", ""), salt):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = secrets.token_urlsafe(32)
+    # Hide sensitive fields
+    user_resp = UserPublic(
+        id=str(user.get("_id")),
+        email=user.get("email"),
+        display_name=user.get("display_name"),
+        high_score=user.get("high_score", 0),
+        avatar=user.get("avatar"),
+    )
+
+    token = _next_token()
     expires_at = int(time.time()) + SESSION_TTL_SECONDS
-    create_document("session", {
-        "user_id": str(user.get("_id")),
+    await create_document_async("session", {
+        "user_id": user_resp.id,
         "token": token,
-        "email": user.get("email"),
+        "email": user_resp.email,
         "expires_at": expires_at,
+        "user_snapshot": user_resp.model_dump(by_alias=True),
     })
 
-    # Hide sensitive fields
-    user_resp = {
-        "_id": str(user.get("_id")),
-        "email": user.get("email"),
-        "display_name": user.get("display_name"),
-        "high_score": user.get("high_score", 0),
-        "avatar": user.get("avatar"),
-    }
-
-    return {"token": token, "user": user_resp}
+    return AuthResponse(token=token, user=user_resp)
 
 
 @app.get("/me")
@@ -170,33 +435,70 @@ async def submit_score(payload: ScorePayload, user=Depends(get_current_user)):
     if score_value < 0:
         raise HTTPException(status_code=400, detail="Score must be >= 0")
 
+    # Shed abusive load before doing any DB work
+    if not _allow_score_write(str(user.get("_id"))):
+        raise HTTPException(status_code=429, detail="Too many score submissions")
+
     # Save score document
-    create_document("score", {
+    await create_document_async("score", {
         "user_id": str(user.get("_id")),
         "display_name": user.get("display_name"),
         "value": score_value,
+    }, write_concern=_SCORE_WRITE_CONCERN)
+    await _record_top_score({
+        "display_name": user.get("display_name"),
+        "value": score_value,
     })
     return {"status": "ok"}
 
 
+_STREAM_CHUNK = 200
+
+
+def _dump_score_chunk(chunk: list) -> bytes:
+    # Validate + serialize the whole chunk in pydantic-core, minus the
+    # surrounding brackets so chunks can be joined into one JSON array
+    return _score_adapter.dump_json(_score_adapter.validate_python(chunk))[1:-1]
+
+
+async def _stream_scores(cursor):
+    yield b'{"scores":['
+    first = True
+    chunk = []
+    async for d in cursor:
+        chunk.append(d)
+        if len(chunk) >= _STREAM_CHUNK:
+            if not first:
+                yield b","
+            yield _dump_score_chunk(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        if not first:
+            yield b","
+        yield _dump_score_chunk(chunk)
+    yield b"]}"
+
+
 @app.get("/scores/top")
-def top_scores(limit: int = 10):
-    # Get top scores by value desc (since helper lacks sort, we sort in Python)
-    docs = get_documents("score", {})
-    docs_sorted = sorted(docs, key=lambda d: int(d.get("value", 0)), reverse=True)[:limit]
-    # Serialize
-    result = [
-        {
-            "display_name": d.get("display_name", "Player"),
-            "value": int(d.get("value", 0)),
-        }
-        for d in docs_sorted
-    ]
-    return {"scores": result}
+async def top_scores(limit: int = 10):
+    # Hot path: serve straight from the materialized top-K cache
+    if _top_cache_loaded and limit <= TOP_CACHE_SIZE:
+        return {"scores": _top_cache[:limit]}
+
+    # Oversized limits (or cache not loaded): sort + limit server-side and
+    # stream docs as they arrive instead of materializing the whole list
+    cursor = get_top_cursor(
+        "score",
+        sort=[("value", -1)],
+        limit=limit,
+        projection={"display_name": 1, "value": 1, "_id": 0},
+    )
+    return StreamingResponse(_stream_scores(cursor), media_type="application/json")
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -207,14 +509,18 @@ def test_database():
     }
 
     try:
-        if db is not None:
+        if async_db is not None:
             response["database"] = "✅ Available"
             response["database_url"] = "✅ Configured"
-            response["database_name"] = getattr(db, "name", "✅ Connected")
+            response["database_name"] = getattr(async_db, "name", "✅ Connected")
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                # Serve the startup snapshot; only hit Mongo's admin command
+                # when it has gone stale
+                if time.time() - app.state.collections_snapshot_ts > COLLECTIONS_SNAPSHOT_TTL:
+                    app.state.collections_snapshot = (await async_db.list_collection_names())[:10]
+                    app.state.collections_snapshot_ts = time.time()
+                response["collections"] = app.state.collections_snapshot
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -232,4 +538,11 @@ def test_database():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -14,6 +14,7 @@ class Flexuser(BaseModel):
     email: EmailStr = Field(..., description="Unique email for login")
     display_name: str = Field(..., min_length=2, max_length=40)
     password_hash: str = Field(..., description="Hashed password (server-side only)")
+    password_salt: Optional[str] = Field(None, description="Per-user scrypt salt, hex-encoded (server-side only)")
     avatar: Optional[str] = Field(None, description="Avatar URL")
     high_score: int = Field(0, ge=0)
     is_active: bool = Field(True)
@@ -27,6 +28,7 @@ class Session(BaseModel):
     token: str
     user_agent: Optional[str] = None
     expires_at: int = Field(..., description="Unix timestamp of expiry")
+    user_snapshot: Optional[dict] = Field(None, description="Denormalized public user fields for fast auth")
 
 class Score(BaseModel):
     """